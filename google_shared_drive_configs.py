@@ -27,10 +27,14 @@ configs = {
             'column_2': int,
             'column_3': str,
             'column_4': str,
-            'column_5': float,
+            'column_5': str,
             'column_6': str,
             'column_7': float,
-        }
+        },
+        # float columns with decimal commas and (non-breaking) space
+        # thousands separators - read as str and cleaned to float
+        # post-read, read_csv cannot strip those separators itself
+        'columns_to_float': ['column_4', 'column_5']
     },
 
 }
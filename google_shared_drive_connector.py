@@ -1,6 +1,11 @@
 import datetime
+import functools
 import io
+import itertools
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import List
 
@@ -8,8 +13,9 @@ import google.auth
 import pandas as pd
 import unidecode
 from dotenv import load_dotenv
-from google.api_core.exceptions import NotFound
-from google.cloud import bigquery
+from google.api_core.exceptions import (
+    BadRequest, GoogleAPIError, NotFound)
+from google.cloud import bigquery, storage
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 
@@ -25,29 +31,94 @@ bq_types_mapping = {
     float: 'FLOAT64',
     bool: 'BOOLEAN'
 }
-folder3_columns_to_float = ['column_4', 'column_5']
+# downloads are network-bound, so a handful of workers is enough to
+# overlap the Drive round-trips without hammering the API
+max_download_workers = 8
+# Drive accepts at most 100 sub-requests per batch request
+drive_batch_size = 100
+# BQ ingest throughput is best in the 10k-50k rows per request range
+bq_load_chunk_rows = 50_000
+
+# swap decimal commas for dots and drop (non-breaking) spaces
+# in one C-level pass
+comma_to_float_trans = str.maketrans({',': '.', ' ': '', '\xa0': ''})
+chars_to_replace_trans =\
+    str.maketrans({char: '_' for char in chars_to_replace})
 
 load_dotenv()
 
 
+# cached at module level - the dataclass generates __eq__ and is
+# therefore unhashable, so lru_cache cannot wrap the method itself
+@functools.lru_cache(maxsize=4096)
+def clean_column(column):
+    '''Replace unwanted values in column name (cached per name).'''
+
+    column = column.replace('[+]', 'plus').replace('[-]', 'minus')
+    return unidecode.unidecode(column.translate(chars_to_replace_trans))
+
+
+def bq_type_from_dtype(dtype):
+    '''Map a pandas dtype to a BQ type (STRING when in doubt).'''
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INT64'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'FLOAT64'
+    return 'STRING'
+
+
 @dataclass
 class DriveConnector:
     '''Connector moves data from Google Shared Drive to Big Query.'''
     shared_drive_name: str
     dataset: str
     recipients: List
+    # optional GCS bucket - when set, CSVs are staged there and BQ
+    # pulls them itself via load_table_from_uri
+    staging_bucket: str = None
     service = None
-    files_added = []
-    counter = 1
 
     def __post_init__(self):
         '''Set credentials, service to call Drive API, BQ Client and Mail.'''
 
-        credentials, self.project = self.get_credentials()
-        self.service = build('drive', 'v3', credentials=credentials)
+        self.credentials, self.project = self.get_credentials()
+        self.service = build('drive', 'v3', credentials=self.credentials)
         self.bq_client =\
-            bigquery.Client(credentials=credentials, project=self.project)
+            bigquery.Client(credentials=self.credentials,
+                            project=self.project)
+        # reuse the main-thread service via the thread-local storage
+        self._thread_local = threading.local()
+        self._thread_local.service = self.service
         self.mail = SendMail(recipients=self.recipients)
+        if self.staging_bucket:
+            storage_client = storage.Client(
+                credentials=self.credentials, project=self.project)
+            self.bucket = storage_client.get_bucket(self.staging_bucket)
+        self.files_added = []
+        # per-folder (= per BQ table) load state, fed by the download
+        # workers chunk by chunk as the files arrive
+        self.pending_files = defaultdict(list)
+        self.pending_jobs = defaultdict(list)
+        self.pending_blobs = defaultdict(list)
+        self.load_schemas = {}
+        self.load_job_configs = {}
+        self._pending_lock = threading.Lock()
+        self._chunk_counter = itertools.count()
+        # configs are static, so build each folder's schema only once
+        self.schemas = {
+            folder_name: self.create_schema(folder_name)
+            for folder_name in configs['all_folders']}
+        # O(1) membership checks and normalized table names, instead of
+        # a list scan and str.replace per Drive item
+        self.valid_folders = frozenset(configs['all_folders'])
+        self.folder_tables = {
+            folder_name: folder_name.replace(' ', '_')
+            for folder_name in configs['all_folders']}
 
     def get_credentials(self):
         '''Based on GOOGLE_APPLICATION_CREDENTIALS get Google credentials.'''
@@ -90,58 +161,91 @@ class DriveConnector:
             # "and ('folder_id' in parents) "
             "and (mimeType = 'text/csv')")
 
-    def get_items_ids(self, shared_drive_id):
-        '''Get item's IDs on Drive by calling the Drive v3 API.'''
+    def get_items_and_folders(self, shared_drive_id):
+        '''Get CSV items and folders from Drive in one API call.'''
 
-        query = self.create_search_file_query()
+        # union both queries and partition client-side - one Drive
+        # round-trip instead of two
+        file_query = self.create_search_file_query()
+        query = (
+            f'({file_query}) '
+            "or (mimeType = 'application/vnd.google-apps.folder')")
         fields = 'nextPageToken, files(id, name, mimeType, parents, trashed)'
         results = self.get_files_from_drive(shared_drive_id, query, fields)
-        return results
+        items = [
+            result for result in results
+            if result['mimeType'] == 'text/csv']
+        folders = [
+            result for result in results
+            if result['mimeType'] == 'application/vnd.google-apps.folder']
+        return items, folders
 
     def get_files_from_drive(self, shared_drive_id, query, fields):
-        '''Execute query on Drive and get results with files.'''
-
-        # Getting File from Drive
-        results = self.service.files().list(
-            q=query,
-            pageSize=1000,
-            # files reference
-            # https://developers.google.com/drive/api/v3/reference/files
-            fields=fields,
-            driveId=shared_drive_id,
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True,
-            spaces='drive',
-            corpora='drive').execute()
-        return results.get('files', [])
-
-    def get_folders_ids(self, shared_drive_id):
-        '''Execute query on Drive and get results with folders IDs.'''
-
-        query = "mimeType = 'application/vnd.google-apps.folder'"
-        fields = 'nextPageToken, files(id, name)'
-        results = self.get_files_from_drive(shared_drive_id, query, fields)
-        return results
+        '''Execute query on Drive and get all result pages with files.'''
+
+        # follow nextPageToken - a single page holds at most 1000
+        # results, so stopping after one would silently drop files
+        files = []
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=query,
+                pageSize=1000,
+                pageToken=page_token,
+                # files reference
+                # https://developers.google.com/drive/api/v3/reference/files
+                fields=fields,
+                driveId=shared_drive_id,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                spaces='drive',
+                corpora='drive').execute()
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return files
+
+    def get_items_metadata(self, item_ids):
+        '''Get items metadata via batched Drive requests.'''
+
+        # bundle up to 100 files().get calls into one multipart batch
+        # request instead of paying a round-trip per item
+        # https://developers.google.com/drive/api/guides/performance#batch-requests
+        metadata = {}
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                metadata[response['id']] = response
+
+        for start in range(0, len(item_ids), drive_batch_size):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for item_id in item_ids[start:start + drive_batch_size]:
+                batch.add(self.service.files().get(
+                    fileId=item_id,
+                    fields='id, name, mimeType, parents, trashed',
+                    supportsAllDrives=True))
+            batch.execute()
+        return metadata
+
+    def fill_missing_parents(self, items):
+        '''Backfill items that files().list returned without parents.'''
+
+        missing_ids = [item['id'] for item in items if 'parents' not in item]
+        if not missing_ids:
+            return items
+        metadata = self.get_items_metadata(missing_ids)
+        return [
+            metadata.get(item['id'], item) if 'parents' not in item else item
+            for item in items]
 
     def change_str_with_comma_to_float(self, df, column):
         '''Change column with commas in Pandas df to float.'''
 
-        to_replace = {
-            ',': '.',
-            ' ': '',
-            '\xa0': ''
-        }
-        df = df.replace({column: to_replace}, regex=False)
-        df[column] = df[column].astype(float)
-        return df
-
-    def prepare_df_folder3(self, df):
-        '''Prepare df for folder3.'''
-
-        # there are couple of columns with float values but with commas
-        # instead of dots, or with white spaces - cleaning needed
-        for column in folder3_columns_to_float:
-            df = self.change_str_with_comma_to_float(df, column)
+        # one str.translate pass beats three successive str.replace ones
+        column_as_str =\
+            df[column].astype('string').str.translate(comma_to_float_trans)
+        df[column] = pd.to_numeric(column_as_str, errors='coerce')
         return df
 
     def prepare_df_folder12(self, df):
@@ -156,13 +260,14 @@ class DriveConnector:
     def prepare_df(self, df, file_name, folder_name):
         '''Prepare df based on folder_name, add ts_ms and clean col names.'''
 
-        if folder_name in ('folder_3',):
-            df = self.prepare_df_folder3(df)
+        for column in configs[folder_name].get('columns_to_float', []):
+            df = self.change_str_with_comma_to_float(df, column)
         if folder_name in ('folder_1', 'folder_2'):
             df = self.prepare_df_folder12(df)
         df['file'] = file_name
         current_ts_ms = int(round(time.time() * 1000))
-        df.insert(0, 'ts_ms', pd.to_datetime(current_ts_ms, unit='ms'))
+        # typed scalar constructor, skips to_datetime dispatch machinery
+        df.insert(0, 'ts_ms', pd.Timestamp(current_ts_ms, unit='ms'))
         df.columns = self.clean_column_names(df.columns)
         return df
 
@@ -170,11 +275,19 @@ class DriveConnector:
         '''Create schema based on types from config file.'''
 
         # create schema based on types from config file (used to load df)
-        schema = []
+        # ts_ms and file are added by prepare_df to every folder
+        schema = [
+            {
+                'name': 'ts_ms',
+                'type': 'TIMESTAMP',
+                'description': 'ts_ms'
+            }
+        ]
         dtypes = configs[folder_name]['dtypes']
+        columns_to_float = configs[folder_name].get('columns_to_float', [])
         for column, type in dtypes.items():
-            if (folder_name == 'folder_3'
-                    and column in folder3_columns_to_float):
+            if column in columns_to_float:
+                # read as str, cleaned to float by prepare_df
                 type = float
             column_cleaned = self.clean_column_str(column)
             schema.append(
@@ -195,54 +308,169 @@ class DriveConnector:
                         'description': date_col
                     }
                 )
+        schema.append(
+            {
+                'name': 'file',
+                'type': 'STRING',
+                'description': 'file'
+            }
+        )
         return schema
 
-    def upload_df_to_bq(self, df, folder_name, file_name):
-        '''Upload df to Big Query by executing job.'''
-
-        # https://cloud.google.com/bigquery/quotas#standard_tables
-        # be nice to API, do not send too many requests
-        if self.counter % 5 == 0:
-            time.sleep(10)
+    def extend_schema_with_df_columns(self, schema, df):
+        '''Extend schema with df columns the folder config omits.'''
+
+        # the CSVs can carry columns beyond the configured dtypes (e.g.
+        # the [+]/[-] ones prepare_df_folder12 normalizes) - load them
+        # with types inferred from the df instead of dropping them
+        schema_columns = {field['name'] for field in schema}
+        extra_fields = [
+            {
+                'name': column,
+                'type': bq_type_from_dtype(df[column].dtype),
+                'description': column
+            }
+            for column in df.columns if column not in schema_columns]
+        return schema + extra_fields
+
+    def df_to_csv_file(self, df, schema):
+        '''Serialize df to an in-memory CSV file matching schema order.'''
+
+        # CSV loads map columns to the schema by position, so align
+        # the df columns to the schema first; mismatches raise
+        # ValueError so the per-file error mail path handles them
+        schema_columns = [field['name'] for field in schema]
+        missing_columns = set(schema_columns).difference(df.columns)
+        if missing_columns:
+            raise ValueError(
+                f'columns missing from data: {sorted(missing_columns)}')
+        unexpected_columns = set(df.columns).difference(schema_columns)
+        if unexpected_columns:
+            raise ValueError(
+                f'unexpected columns in data: {sorted(unexpected_columns)}')
+        df = df[schema_columns]
+        csv_buffer = io.StringIO()
+        df.to_csv(csv_buffer, index=False, header=False)
+        return io.BytesIO(csv_buffer.getvalue().encode('utf-8'))
+
+    def serialize_chunk(self, folder_name, df):
+        '''Serialize a prepared chunk to CSV matching the folder schema.'''
+
+        with self._pending_lock:
+            if folder_name not in self.load_schemas:
+                # the first chunk of a folder fixes the schema (and
+                # column order) all its later chunks are aligned to
+                self.load_schemas[folder_name] =\
+                    self.extend_schema_with_df_columns(
+                        self.schemas[folder_name], df)
+                self.load_job_configs[folder_name] =\
+                    bigquery.LoadJobConfig(
+                        write_disposition='WRITE_APPEND',
+                        schema=self.load_schemas[folder_name],
+                        source_format=bigquery.SourceFormat.CSV,
+                        allow_quoted_newlines=True
+                    )
+            schema = self.load_schemas[folder_name]
+        return self.df_to_csv_file(df, schema)
+
+    def queue_file(self, folder_name, csv_files):
+        '''Start the Big Query loads for one fully parsed file.'''
+
+        # only whole files reach this point - if a later chunk of a
+        # file fails to parse, no chunk of it may commit, or the file
+        # lands in the dedupe column with partial data and every
+        # future run skips it
         table_id = f'{self.dataset}.{folder_name}'
-        schema = self.create_schema(folder_name)
-        job_config = bigquery.LoadJobConfig(
-            write_disposition='WRITE_APPEND',
-            schema=schema
-        )
-        try:
-            job = self.bq_client.load_table_from_dataframe(
-                df,
-                table_id,
-                job_config=job_config,
-            )
-            job.result()  # Wait for the job to complete.
-            print(f'table {table_id} uploaded to BQ.')
-        except ValueError as error:
-            self.send_error_mail(file_name, folder_name, error)
-        self.counter += 1
+        with self._pending_lock:
+            job_config = self.load_job_configs[folder_name]
+        if self.staging_bucket:
+            # with staged URIs BigQuery pulls the files itself - no
+            # client-side upload to the BQ API and the multi-file load
+            # ingests in parallel server-side
+            blobs = []
+            try:
+                for csv_file in csv_files:
+                    chunk_id =\
+                        f'{int(time.time())}_{next(self._chunk_counter)}'
+                    blob = self.bucket.blob(f'{folder_name}/{chunk_id}.csv')
+                    blob.upload_from_file(csv_file, rewind=True)
+                    blobs.append(blob)
+            except GoogleAPIError:
+                # a half-staged file must not linger in the bucket or
+                # sneak into the folder's load
+                for blob in blobs:
+                    blob.delete()
+                raise
+            with self._pending_lock:
+                self.pending_blobs[folder_name].extend(blobs)
+        else:
+            # stream the CSVs straight to BQ - no parquet encoding of
+            # every value on the way, BQ parses them server-side; the
+            # jobs run concurrently, only finish_pending_loads waits
+            jobs = [
+                self.bq_client.load_table_from_file(
+                    csv_file, table_id, job_config=job_config)
+                for csv_file in csv_files]
+            with self._pending_lock:
+                self.pending_jobs[folder_name].extend(jobs)
+
+    def finish_pending_loads(self):
+        '''Wait for each folder's queued loads and confirm its files.'''
+
+        for folder_name, file_names in self.pending_files.items():
+            table_id = f'{self.dataset}.{folder_name}'
+            try:
+                if self.staging_bucket:
+                    uris = [
+                        f'gs://{self.staging_bucket}/{blob.name}'
+                        for blob in self.pending_blobs[folder_name]]
+                    job = self.bq_client.load_table_from_uri(
+                        uris,
+                        table_id,
+                        job_config=self.load_job_configs[folder_name])
+                    job.result()  # Wait for the job to complete.
+                    # the staged chunks are only a transport vehicle -
+                    # drop them so the bucket does not grow per run
+                    for blob in self.pending_blobs[folder_name]:
+                        blob.delete()
+                else:
+                    for job in self.pending_jobs[folder_name]:
+                        job.result()  # Wait for the jobs to complete.
+                print(f'table {table_id} uploaded to BQ.')
+            except (ValueError, BadRequest) as error:
+                self.send_error_mail(
+                    ', '.join(file_names), folder_name, error)
+                continue
+            self.files_added.extend(file_names)
+        self.pending_files.clear()
+        self.pending_jobs.clear()
+        self.pending_blobs.clear()
 
     def clean_column_str(self, column):
         '''Replace unwanted values in column name.'''
 
-        column = column.replace('[+]', 'plus')
-        column = column.replace('[-]', 'minus')
-        for char in chars_to_replace:
-            column = column.replace(char, '_')
-        return unidecode.unidecode(column)
+        return clean_column(column)
 
     def clean_column_names(self, columns):
         '''Replace unwanted values in column names.'''
 
-        columns = columns.str.replace('[+]', 'plus', regex=False)
-        columns = columns.str.replace('[-]', 'minus', regex=False)
-        for char in chars_to_replace:
-            columns = columns.str.replace(char, '_', regex=False)
-        columns = [unidecode.unidecode(column) for column in columns]
-        return columns
+        # the Index is short, so a single list pass through the cached
+        # clean_column beats eight Series.str.replace Index rebuilds
+        return [clean_column(column) for column in columns]
+
+    def get_thread_service(self):
+        '''Get a Drive service owned by the current thread.
 
-    def get_df_from_file_id(self, file_id, file_name, folder_name):
-        '''Download df from Drive based on file ID.'''
+        googleapiclient service objects are not thread-safe, so each
+        download worker builds its own service once and reuses it.
+        '''
+        if not hasattr(self._thread_local, 'service'):
+            self._thread_local.service =\
+                build('drive', 'v3', credentials=self.credentials)
+        return self._thread_local.service
+
+    def get_read_csv_params(self, folder_name):
+        '''Create pd.read_csv params based on folder config.'''
 
         config = configs[folder_name]
         params = {
@@ -253,8 +481,27 @@ class DriveConnector:
             'dtype': config.get('dtypes'),
             'delimiter': config.get('delimiter', ','),
             'decimal': config.get('decimal', '.'),
+            'thousands': config.get('thousands'),
         }
-        request = self.service.files().get_media(fileId=file_id)
+        # the pyarrow engine parses the CSV on multiple threads, but
+        # only supports a subset of options - use it for folders that
+        # need none of the C-engine-only ones; folder_3 qualifies now
+        # that its float columns are cleaned post-read, folder_1/2
+        # stay on the C engine for skiprows
+        c_engine_only = ('skip_rows', 'thousands', 'dayfirst', 'decimal')
+        if not any(config.get(option) for option in c_engine_only):
+            params = {
+                option: value for option, value in params.items()
+                if value is not None}
+            params['engine'] = 'pyarrow'
+        return params
+
+    def get_dfs_from_file_id(self, file_id, file_name, folder_name):
+        '''Download file from Drive based on file ID as df chunks.'''
+
+        params = self.get_read_csv_params(folder_name)
+        service = self.get_thread_service()
+        request = service.files().get_media(fileId=file_id)
         fh = io.BytesIO()
         downloader = MediaIoBaseDownload(fh, request)
         done = False
@@ -262,8 +509,16 @@ class DriveConnector:
             status, done = downloader.next_chunk()
             print(f'Download {file_name} {int(status.progress() * 100)}%.')
         fh.seek(0)
-        df = pd.read_csv(fh, **params)
-        return df
+        if params.get('engine') == 'pyarrow':
+            # the pyarrow engine does not support chunksize - folders
+            # on it (folder_3) get one parallel whole-file parse
+            return [pd.read_csv(fh, **params)]
+        # an iterator of bounded chunks - the caller serializes each
+        # one before the next is decoded, so only O(chunk) decoded
+        # rows are alive per worker; the serialized CSV bytes of the
+        # current file accumulate until it fully parses (per-file
+        # atomicity over per-chunk streaming)
+        return pd.read_csv(fh, chunksize=bq_load_chunk_rows, **params)
 
     def send_error_mail(self, file_name, folder_name, error):
         '''Send mail with error text.'''
@@ -276,59 +531,99 @@ class DriveConnector:
         message = self.mail.create_message(mail_subject, error_text)
         self.mail.send_mail(message)
 
-    def upload_csv_to_bq(self, folder_name, file_name, file_id):
-        '''Download CSV as df based on file_id and upload it to Big Query.'''
+    def download_and_queue(self, folder_name, file_name, file_id):
+        '''Download CSV chunks based on file_id and queue them for BQ.'''
 
-        print(f'Uploading, folder: {folder_name}, file: {file_name}')
+        print(f'Downloading, folder: {folder_name}, file: {file_name}')
         try:
-            df = self.get_df_from_file_id(file_id, file_name, folder_name)
-            if df.empty:
+            chunks = self.get_dfs_from_file_id(
+                file_id, file_name, folder_name)
+            # serialize the whole file before starting any load - only
+            # fully parsed files may commit (see queue_file)
+            csv_files = []
+            for df in chunks:
+                if df.empty:
+                    continue
+                df = self.prepare_df(df, file_name, folder_name)
+                csv_files.append(self.serialize_chunk(folder_name, df))
+            if not csv_files:
                 raise ValueError('CSV is empty!')
         except ValueError as error:
             self.send_error_mail(file_name, folder_name, error)
-            return
-        df = self.prepare_df(df, file_name, folder_name)
-        # print(dict(zip(df.columns, df.iloc[0])))
-        self.upload_df_to_bq(df, folder_name, file_name)
-        self.files_added.append(file_name)
+            return False
+        try:
+            self.queue_file(folder_name, csv_files)
+        except GoogleAPIError as error:
+            self.send_error_mail(file_name, folder_name, error)
+            return False
+        return True
+
+    def download_candidates(self, candidates):
+        '''Download candidate CSVs in parallel and queue them per folder.'''
+
+        with ThreadPoolExecutor(max_workers=max_download_workers)\
+                as executor:
+            futures = {
+                executor.submit(
+                    self.download_and_queue, folder_name, file_name, file_id):
+                (folder_name, file_name)
+                for folder_name, file_name, file_id in candidates}
+            for future, (folder_name, file_name) in futures.items():
+                if future.result():
+                    self.pending_files[folder_name].append(file_name)
 
-    def if_table_not_in_bq(self, folder_name, file_name):
-        '''Check if table not in Big Query already.'''
+    def get_existing_files(self, folder_name, file_names):
+        '''Get files from file_names already loaded to folder's BQ table.'''
 
         sql_query = (f'''
-        SELECT `file`
+        SELECT DISTINCT `file`
         FROM `{self.project}.{self.dataset}.{folder_name}`
-        WHERE `file` = '{file_name}'
-        LIMIT 1;
+        WHERE `file` IN UNNEST(@file_names);
         ''')
-        query_job = self.bq_client.query(sql_query)
+        # file names travel as parameters, so the SQL text stays
+        # constant per folder - no injection via file names and BQ can
+        # serve repeated runs from its query cache
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter(
+                    'file_names', 'STRING', file_names)
+            ],
+            use_query_cache=True
+        )
+        query_job = self.bq_client.query(sql_query, job_config=job_config)
         try:
             result = query_job.result()
-            if result.total_rows != 0:
-                # This file is already in BQ!
-                return False
         except NotFound:
-            # Table not exists
-            return True
-        # Not in BQ, proceed
-        return True
+            # Table not exists, so no file was loaded yet
+            return set()
+        return {row.file for row in result}
 
     def iterate_through_items(self, items, folders_dict):
         '''Iterate through items on Drive and upload matched to Big Query.'''
 
-        for item in items:
-            if item['trashed']:
-                continue
-            parent = item['parents'][0]
-            if folders_dict.get(parent):
-                file_id = item['id']
-                file_name = item['name']
-                folder_name = folders_dict[parent]
-                if folder_name in configs['all_folders']:
-                    folder_name = folder_name.replace(' ', '_')
-                    if self.if_table_not_in_bq(folder_name, file_name):
-                        self.upload_csv_to_bq(
-                            folder_name, file_name, file_id)
+        files_per_folder = defaultdict(list)
+        items = self.fill_missing_parents(items)
+        matched_items = (
+            item for item in items
+            if not item['trashed']
+            and folders_dict.get(item.get('parents', [None])[0])
+            in self.valid_folders)
+        for item in matched_items:
+            folder_name =\
+                self.folder_tables[folders_dict[item['parents'][0]]]
+            files_per_folder[folder_name].append((item['name'], item['id']))
+        # one query per folder instead of one per file
+        self.existing_files = {
+            folder_name: self.get_existing_files(
+                folder_name, [file_name for file_name, _ in files])
+            for folder_name, files in files_per_folder.items()}
+        candidates = [
+            (folder_name, file_name, file_id)
+            for folder_name, files in files_per_folder.items()
+            for file_name, file_id in files
+            if file_name not in self.existing_files[folder_name]]
+        self.download_candidates(candidates)
+        self.finish_pending_loads()
         self.send_confirmation_mail()
 
     def send_confirmation_mail(self):
@@ -347,14 +642,17 @@ class DriveConnector:
     def run_transfer(self):
         '''Run the Drive to Big Query connector.'''
 
-        shared_drive_id = self.get_shared_drive_id()
-        folders_ids = self.get_folders_ids(shared_drive_id)
-        folders_dict = {d['id']: d['name'] for d in folders_ids}
-        items = self.get_items_ids(shared_drive_id)
-        if not items:
-            RuntimeError('No files found on shared drive. Process Completed.')
-        else:
-            self.iterate_through_items(items, folders_dict)
+        try:
+            shared_drive_id = self.get_shared_drive_id()
+            items, folders = self.get_items_and_folders(shared_drive_id)
+            folders_dict = {d['id']: d['name'] for d in folders}
+            if not items:
+                RuntimeError(
+                    'No files found on shared drive. Process Completed.')
+            else:
+                self.iterate_through_items(items, folders_dict)
+        finally:
+            self.mail.close()
 
 
 if __name__ == "__main__":
@@ -79,8 +79,19 @@ class StorageConnector:
         gcs_file = f'{self.bucket_name}/{blob.name}'
         with self.storage_file_system.open(gcs_file, 'rb') as f:
             with gzip.open(f, 'rb') as g:
-                for lines, l in enumerate(g):
-                    pass
+                # count newlines in 1MB chunks - bytes.count runs in C,
+                # so the Python loop runs per megabyte, not per line
+                newlines = 0
+                ends_with_newline = True
+                while chunk := g.read(1 << 20):
+                    newlines += chunk.count(b'\n')
+                    ends_with_newline = chunk.endswith(b'\n')
+            lines = newlines
+            if not ends_with_newline:
+                # the last line still counts without a trailing newline
+                lines += 1
+            # without the header line, as before
+            lines -= 1
             print("Rows counted: ", lines)
             return lines
 
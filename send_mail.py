@@ -1,5 +1,6 @@
 import smtplib
 import ssl
+import threading
 from dataclasses import dataclass
 from email import encoders
 from email.mime.base import MIMEBase
@@ -17,6 +18,12 @@ MAIL_SENDER = ''
 @dataclass
 class SendMail:
     recipients: List
+    _server = None
+
+    def __post_init__(self):
+        # one mail can be sent at a time - the connection is shared
+        # and callers may mail from worker threads
+        self._lock = threading.Lock()
 
     def create_message(self, subject, body):
         message = MIMEMultipart()
@@ -39,9 +46,35 @@ class SendMail:
         message.attach(part)
         return message
 
+    def get_server(self):
+        # connect and login once, then reuse the connection - the TLS
+        # handshake and AUTH are the expensive part of every mail
+        if self._server is None:
+            context = ssl.create_default_context()
+            self._server =\
+                smtplib.SMTP_SSL(MAIL_HOST, MAIL_PORT, context=context)
+            self._server.login(MAIL_LOGIN, MAIL_PASSWORD)
+        return self._server
+
     def send_mail(self, message):
         text = message.as_string()
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(MAIL_HOST, MAIL_PORT, context=context) as server:
-            server.login(MAIL_LOGIN, MAIL_PASSWORD)
-            server.sendmail(MAIL_SENDER, self.recipients, text)
+        with self._lock:
+            try:
+                server = self.get_server()
+                server.sendmail(MAIL_SENDER, self.recipients, text)
+            except smtplib.SMTPServerDisconnected:
+                # the server drops idle connections - reconnect once
+                # and retry
+                self._server = None
+                server = self.get_server()
+                server.sendmail(MAIL_SENDER, self.recipients, text)
+
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except smtplib.SMTPServerDisconnected:
+                    # already gone, nothing to close
+                    pass
+                self._server = None